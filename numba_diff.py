@@ -0,0 +1,29 @@
+from numba import njit, prange
+import numpy as np
+
+
+# 💡 Toleranzlogik: |a-b| < tol; kleine Werte (< 1) mit 1e-6, damit z.B.
+#     Zinssätze (0.03 vs. 0.06) nicht als 'gleich' gelten. NaN = keine Zahl.
+#     Kein fastmath: damit dürfte LLVM NaN-Prüfungen wegoptimieren.
+@njit(inline="always")
+def _is_close(x, y, tol):
+    if np.isnan(x) or np.isnan(y):
+        return False
+    if max(abs(x), abs(y)) < 1:
+        return abs(x - y) < 1e-6
+    return abs(x - y) < tol
+
+
+# 💡 Zellvergleich als kompilierter Kernel über (Zeilen x Spalten)-Matrizen.
+#     a/b: numerische Sicht (NaN = keine Zahl), neq: Rohwerte ungleich.
+#     Ergebnis: pro Zeile ein Bitfeld, Bit j gesetzt = Spalte j weicht ab.
+@njit(parallel=True, cache=True)
+def diff_mask(a, b, neq, tol):
+    n_rows, n_cols = a.shape
+    n_words = (n_cols + 63) // 64
+    out = np.zeros((n_rows, n_words), dtype=np.uint64)
+    for i in prange(n_rows):
+        for j in range(n_cols):
+            if neq[i, j] and not _is_close(a[i, j], b[i, j], tol):
+                out[i, j // 64] |= np.uint64(1) << np.uint64(j % 64)
+    return out
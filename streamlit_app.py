@@ -1,7 +1,15 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
+import polars as pl
+import datetime
+import hashlib
 import io
 import re
+from dataclasses import dataclass
+from functools import partial
+
+from numba_diff import diff_mask
 
 st.set_page_config(page_title="Excel Vergleichstool", layout="wide")
 st.title("🔍 Vertrags-/Asset-Datenvergleich (Test vs. Prod)")
@@ -16,52 +24,77 @@ mode = st.radio(
 # Tabs für Sprache
 tab_de, tab_en = st.tabs(["🇩🇪 Deutsch", "🇬🇧 English"])
 
-# 💡 Gemeinsame Bereinigungsfunktion für Closings
-@st.cache_data
-def clean_and_prepare(uploaded_file, id_col, asset_col):
-    df_raw = pd.read_excel(uploaded_file, sheet_name=0, header=None)
+_WS_RE = re.compile(r"\s+")  # Mehrfach-Leerzeichen / Umbrüche in Kopfzeilen
 
-    header_1 = df_raw.iloc[1]
-    header_2 = df_raw.iloc[2]
-    header_3 = df_raw.iloc[3]
 
-    header_1 = header_1.fillna(method="ffill")
-    header_2 = header_2.fillna(method="ffill")
+# 💡 Gemeinsame Bereinigungsfunktion für Closings
+#     cache_resource statt cache_data: das bereinigte DataFrame wird bei jedem
+#     Rerun ohne Pickle-Roundtrip zurückgegeben (nur lesend verwenden!).
+#     Cache-Key ist der Digest der Datei; die Bytes (_content) werden nicht gehasht
+@st.cache_resource
+def clean_and_prepare(_content, digest, id_col, asset_col):
+    df_raw = pd.read_excel(
+        io.BytesIO(_content),
+        sheet_name=0,
+        header=None,
+        engine="calamine",
+    )
 
-    df_data = df_raw.iloc[4:].copy()
-    df_data.reset_index(drop=True, inplace=True)
+    # Verbundene Zellen: Beschreibung/Konto nach rechts auffüllen
+    header_1 = df_raw.iloc[1].ffill()
+    header_2 = df_raw.iloc[2].ffill()
+    header_3 = df_raw.iloc[3]
 
-    columns_combined = []
-    for i in range(len(header_1)):
-        if i < 9:
-            columns_combined.append(header_1[i])
-        else:
-            beschreibung = re.sub(r"\s+", " ", str(header_1[i]).strip())
-            konto_nr = str(header_2[i]).strip()
-            soll_haben = str(header_3[i]).strip()
-            name = f"{beschreibung} - {konto_nr}_IFRS16 - {soll_haben}"
-            columns_combined.append(name)
+    df_data = df_raw.iloc[4:].reset_index(drop=True)
 
-    df_data.columns = columns_combined
+    # Ab Spalte 10: "Beschreibung - Konto_IFRS16 - Soll/Haben"
+    h1 = header_1.to_numpy()
+    h2 = header_2.to_numpy()
+    h3 = header_3.to_numpy()
+    df_data.columns = list(h1[:9]) + [
+        f"{_WS_RE.sub(' ', str(h1[i]).strip())} - "
+        f"{str(h2[i]).strip()}_IFRS16 - {str(h3[i]).strip()}"
+        for i in range(9, len(h1))
+    ]
 
     df_data[id_col] = df_data[id_col].astype(str)
     df_data[asset_col] = df_data[asset_col].astype(str)
-    df_data["Key"] = df_data[id_col] + "_" + df_data[asset_col]
-
+    # Key in einem Arrow-Kernel verketten (wie bei der Vertragsliste);
+    # leere IDs werden "nan" (astype(str) lässt NaN unter pandas 3 stehen)
+    keys = pl.from_pandas(df_data[[id_col, asset_col]])
+    df_data["Key"] = (
+        keys.select(
+            pl.concat_str(pl.col(id_col, asset_col).fill_null("nan"), separator="_")
+        )
+        .to_series()
+        .to_numpy()
+    )
     return df_data.set_index("Key")
 
 
+def _warn_duplicate_keys(index):
+    # is_unique wird am Index gecacht; die Warnung kostet bei Reruns kaum etwas
+    if index.is_unique:
+        return
+    dup = index.duplicated(keep="first")
+    st.warning(
+        "⚠️ Doppelte Keys gefunden (nur das erste Vorkommen wird verglichen): "
+        + ", ".join(map(str, index[dup].unique()[:20]))
+    )
+
+
 # 💡 Vorbereitung für Vertragsliste (mehrere Zeilen pro Contract/Asset möglich,
 #     mit Matching auf Payment/Option ID, falls vorhanden)
 @st.cache_data
 def prepare_contract_list(
-    uploaded_file,
+    _content,
+    digest,
     system_id_col,
     asset_col,
     payment_id_col=None,
     option_id_col=None,
 ):
-    df = pd.read_excel(uploaded_file)
+    df = pd.read_excel(io.BytesIO(_content), engine="calamine")
 
     # Spaltennamen normalisieren: trim + Quotes entfernen
     df.columns = (
@@ -123,654 +156,742 @@ def prepare_contract_list(
         if has_option:
             key_cols.append(option_id_col)
 
-        df["Key"] = df[key_cols].astype(str).agg("_".join, axis=1)
+        # Leere IDs werden "nan" statt eines null-Keys (wie bei den Closings)
+        keys = pl.from_pandas(df[key_cols])
+        df["Key"] = (
+            keys.select(
+                pl.concat_str(pl.col(key_cols).fill_null("nan"), separator="_")
+            )
+            .to_series()
+            .to_numpy()
+        )
 
     else:
         # 🔁 Fallback: Zeilenindex pro (System, Asset)
+        #    Sortierung + Zähler laufen in Polars, die Werte bleiben im pandas-DF.
+        #    Leere Zellen als "nan" (wie astype(str) unter pandas 2), sonst würde
+        #    concat_str null liefern und diese Zeilen blieben unsortiert
+        order = pl.DataFrame(
+            {
+                "system": pl.from_pandas(df[system_id_col]).fill_null("nan"),
+                "asset": pl.from_pandas(df[asset_col]).fill_null("nan"),
+            }
+        )
         other_cols = [c for c in df.columns if c not in [system_id_col, asset_col]]
         if other_cols:
-            df["_sort_key"] = df[other_cols].astype(str).agg("|".join, axis=1)
-            df = df.sort_values([system_id_col, asset_col, "_sort_key"])
-            df = df.drop(columns=["_sort_key"])
-        else:
-            df = df.sort_values([system_id_col, asset_col])
+            others = df[other_cols].astype(str)
+            others.columns = [str(i) for i in range(len(other_cols))]
+            order = order.with_columns(
+                pl.from_pandas(others)
+                .select(pl.concat_str(pl.all().fill_null("nan"), separator="|"))
+                .to_series()
+                .alias("sort_key")
+            )
 
-        df["LineIndex"] = df.groupby([system_id_col, asset_col]).cumcount() + 1
-        df["Key"] = (
-            df[system_id_col]
-            + "_"
-            + df[asset_col]
-            + "_"
-            + df["LineIndex"].astype(str)
+        order = (
+            order.with_row_index("row")
+            .sort(pl.exclude("row"), maintain_order=True)
+            .with_columns(
+                (pl.int_range(pl.len()).over("system", "asset") + 1).alias(
+                    "LineIndex"
+                )
+            )
+            .with_columns(
+                pl.concat_str(["system", "asset", "LineIndex"], separator="_").alias(
+                    "Key"
+                )
+            )
+        )
+        df = df.iloc[order["row"].to_numpy()].assign(
+            LineIndex=order["LineIndex"].to_numpy(),
+            Key=order["Key"].to_numpy(),
         )
 
-    return df.set_index("Key")
+    df = df.set_index("Key")
+
+    # Doppelte Keys einmalig entfernen (erstes Vorkommen gewinnt)
+    _warn_duplicate_keys(df.index)
+    return df[~df.index.duplicated(keep="first")]
 
 
 # ===== Nur Logik: Numerische Abweichungen < 1 ignorieren =====
 TOL = 1.0  # Basis-Schwellwert; wird dynamisch angepasst
+_NUM_CLEAN_RE = re.compile(r"[\xa0€% ’']")  # Währungs-/%-Zeichen, Tausender-Trenner
 
 
-def _try_parse_number(val):
-    """Versucht, val als Zahl zu interpretieren (DE/EN-Formate, Währungs-/%-Zeichen)."""
-    if pd.isna(val):
-        return False, None
-    if isinstance(val, (int, float)) and not isinstance(val, bool):
-        return True, float(val)
-    s = str(val).strip()
-    if s == "":
-        return False, None
-
+def parse_numeric_series(s: pd.Series) -> pd.Series:
+    """
+    Interpretiert eine ganze Spalte als Zahlen (DE/EN-Formate, Währungs-/%-Zeichen).
+    Nicht interpretierbare Werte werden zu NaN (Index bleibt erhalten).
+    """
+    # Reine Zahlenspalte: keine Typprüfung je Wert nötig
+    if s.dtype.kind in "iuf":
+        return s.astype("float64")
+
+    out = np.full(len(s), np.nan)
+
+    # Echte Zahlen (ohne bool) direkt übernehmen
+    kinds = s.map(type)
+    num_types = [
+        k for k in kinds.unique() if issubclass(k, (int, float)) and k is not bool
+    ]
+    is_num = kinds.isin(num_types).to_numpy()
+    out[is_num] = pd.to_numeric(s[is_num], errors="coerce").to_numpy(dtype="float64")
+
+    # Alles andere als Text parsen: zuerst DE (1.234,56), dann EN (1,234.56)
+    is_text = ~is_num & s.notna().to_numpy()
     s_clean = (
-        s.replace("\xa0", "")
-        .replace("€", "")
-        .replace("%", "")
-        .replace(" ", "")
-        .replace("’", "")
-        .replace("'", "")
+        s[is_text].astype(str).str.strip().str.replace(_NUM_CLEAN_RE, "", regex=True)
     )
-    # DE: 1.234,56
-    try:
-        s_de = s_clean.replace(".", "").replace(",", ".")
-        return True, float(s_de)
-    except Exception:
-        pass
-    # EN: 1,234.56
-    try:
-        s_en = s_clean.replace(",", "")
-        return True, float(s_en)
-    except Exception:
-        pass
-    return False, None
-
-
-def nearly_equal(a, b, tol=TOL) -> bool:
+    de = pd.to_numeric(
+        s_clean.str.replace(".", "", regex=False).str.replace(",", ".", regex=False),
+        errors="coerce",
+    )
+    en = pd.to_numeric(s_clean.str.replace(",", "", regex=False), errors="coerce")
+    out[is_text] = de.fillna(en).to_numpy(dtype="float64")
+    return pd.Series(out, index=s.index)
+
+
+def raw_neq(a: pd.Series, b: pd.Series) -> np.ndarray:
     """
-    True, wenn a und b numerisch sind und |a-b| < tol.
-    Für kleine Werte (< 1) wird eine deutlich kleinere Toleranz verwendet,
-    damit z.B. Zinssätze (0.03 vs. 0.06) nicht als 'gleich' gelten.
+    Roh-Abweichung zweier gleich indizierter Spalten wie bei DataFrame.compare:
+    ungleich, außer beide Werte fehlen (NA beim Vergleich zählt als ungleich).
     """
-    ok_a, fa = _try_parse_number(a)
-    ok_b, fb = _try_parse_number(b)
-    if ok_a and ok_b:
-        max_abs = max(abs(fa), abs(fb))
-
-        # Kleine Werte: z.B. Zinssätze, Faktoren etc.
-        if max_abs < 1:
-            dynamic_tol = 1e-6  # bei Bedarf z.B. 0.0001
-        else:
-            # Normale Beträge: Toleranz wie bisher (1.0)
-            dynamic_tol = tol
+    both_na = (a.isna() & b.isna()).to_numpy()
+    # Unterschiedliche dtypes (z.B. str in Test, gemischt object in Prod) würde
+    # pandas 3 nicht vergleichen ("Expected bytes"): dann zellweise als object
+    if a.dtype != b.dtype:
+        a, b = a.astype(object), b.astype(object)
+    return a.ne(b).to_numpy(dtype=bool, na_value=True) & ~both_na
 
-        return abs(fa - fb) < dynamic_tol
-    return False
 
+def _as_text(values: np.ndarray) -> list:
+    # Wie f"{v}"; Zahlen/Bools über tolist, str() auf Python-Zahlen ist schneller.
+    # datetime64/timedelta64 über Timestamp/Timedelta ("2024-01-01 00:00:00")
+    if values.dtype.kind in "biuf":
+        values = values.tolist()
+    elif values.dtype.kind in "Mm":
+        values = pd.Index(values).astype(object)
+    return list(map(str, values))
 
-# =============================================================
 
-# 🇩🇪 Deutsch
-with tab_de:
-    if mode.startswith("1️⃣"):
-        # ====== SECTION 1: Closings vergleichen (DE) ======
-        st.subheader("📂 Dateien für Closings hochladen")
-        file_test = st.file_uploader(
-            "Test-Datei (Closings) hochladen", type=["xlsx"], key="test_de_closings"
+def collect_diffs(t, p, tol=TOL):
+    """
+    Vergleich zweier gleich beschrifteter DataFrames (Index und Spalten).
+    Liefert je Key mit Abweichungen "Spalte: Test=... / Prod=...; ...".
+    raw_neq grenzt auf Zeilen/Spalten mit Roh-Abweichungen ein;
+    nur diese Zellen werden numerisch geparst und gegen die Toleranz geprüft.
+    """
+    if t.empty:
+        return pd.Series(dtype=object)
+    neq = np.column_stack(
+        [raw_neq(t.iloc[:, j], p.iloc[:, j]) for j in range(t.shape[1])]
+    )
+    row_pos = np.flatnonzero(neq.any(axis=1))
+    col_pos = np.flatnonzero(neq.any(axis=0))
+    if not len(row_pos):
+        return pd.Series(dtype=object)
+
+    cols = t.columns[col_pos]
+    neq = neq[np.ix_(row_pos, col_pos)]
+    keys = t.index[row_pos]
+    n_rows, n_cols = neq.shape
+    vals_t, vals_p = [], []
+    num_t = np.full((n_rows, n_cols), np.nan)
+    num_p = np.full((n_rows, n_cols), np.nan)
+    for j, c in enumerate(col_pos):
+        a = t.iloc[row_pos, c]
+        b = p.iloc[row_pos, c]
+        vals_t.append(a.to_numpy())
+        vals_p.append(b.to_numpy())
+        idx = np.flatnonzero(neq[:, j])
+        num_t[idx, j] = parse_numeric_series(a.iloc[idx]).to_numpy()
+        num_p[idx, j] = parse_numeric_series(b.iloc[idx]).to_numpy()
+
+    # Bitfeld pro Zeile; Texte nur für Zeilen mit mindestens einer Abweichung
+    mask = diff_mask(num_t, num_p, neq, tol)
+    rows = np.flatnonzero(mask.any(axis=1))
+    bits = np.unpackbits(
+        mask[rows].astype("<u8").view(np.uint8), axis=1, bitorder="little"
+    )[:, :n_cols]
+
+    r_idx, c_idx = np.nonzero(bits)
+    if not len(r_idx):
+        return pd.Series(dtype=object)
+    rows = rows[r_idx]
+
+    # Werte spaltenweise in Text wandeln (ein Aufruf je Spalte statt je Zelle)
+    tv = np.empty(len(rows), dtype=object)
+    pv = np.empty(len(rows), dtype=object)
+    for j in np.unique(c_idx):
+        sel = c_idx == j
+        tv[sel] = _as_text(vals_t[j][rows[sel]])
+        pv[sel] = _as_text(vals_p[j][rows[sel]])
+
+    # "Spalte: Test=... / Prod=..." verketten und je Key mit "; " zusammenfügen
+    parts = (
+        pl.DataFrame(
+            {
+                "Key": keys[rows].tolist(),
+                "col": np.asarray(_as_text(cols.to_numpy()))[c_idx].tolist(),
+                "test": tv.tolist(),
+                "prod": pv.tolist(),
+            }
         )
-        file_prod = st.file_uploader(
-            "Prod-Datei (Closings) hochladen", type=["xlsx"], key="prod_de_closings"
+        .group_by("Key", maintain_order=True)
+        .agg(
+            pl.concat_str(
+                ["col", pl.lit(": Test="), "test", pl.lit(" / Prod="), "prod"]
+            )
+            .str.join("; ")
+            .alias("diff")
         )
+    )
+    return pd.Series(parts["diff"].to_numpy(), index=parts["Key"].to_numpy())
 
-        id_col = "Vertrags-ID"
-        asset_col = "Asset-ID"
-
-        if file_test and file_prod:
-            df_test = clean_and_prepare(file_test, id_col, asset_col)
-            df_prod = clean_and_prepare(file_prod, id_col, asset_col)
-
-            columns_test = set(df_test.columns) - {id_col, asset_col, "Key"}
-            columns_prod = set(df_prod.columns) - {id_col, asset_col, "Key"}
-
-            only_in_test = sorted(columns_test - columns_prod)
-            only_in_prod = sorted(columns_prod - columns_test)
-
-            if only_in_test:
-                st.warning("⚠️ Spalten nur in Test:")
-                st.code("\n".join(only_in_test))
-            if only_in_prod:
-                st.warning("⚠️ Spalten nur in Prod:")
-                st.code("\n".join(only_in_prod))
-            if not only_in_test and not only_in_prod:
-                st.success("✅ Alle Spalten stimmen überein.")
-
-            col1, col2 = st.columns(2)
-            with col1:
-                out_test = io.BytesIO()
-                with pd.ExcelWriter(out_test, engine="xlsxwriter") as writer:
-                    df_test.reset_index().to_excel(
-                        writer, index=False, sheet_name="Bereinigt_Test"
-                    )
-                st.download_button(
-                    "⬇️ Bereinigte Test-Datei",
-                    data=out_test.getvalue(),
-                    file_name="bereinigt_test.xlsx",
-                    mime=(
-                        "application/vnd.openxmlformats-officedocument."
-                        "spreadsheetml.sheet"
-                    ),
-                )
-            with col2:
-                out_prod = io.BytesIO()
-                with pd.ExcelWriter(out_prod, engine="xlsxwriter") as writer:
-                    df_prod.reset_index().to_excel(
-                        writer, index=False, sheet_name="Bereinigt_Prod"
-                    )
-                st.download_button(
-                    "⬇️ Bereinigte Prod-Datei",
-                    data=out_prod.getvalue(),
-                    file_name="bereinigt_prod.xlsx",
-                    mime=(
-                        "application/vnd.openxmlformats-officedocument."
-                        "spreadsheetml.sheet"
-                    ),
-                )
 
-            all_keys = sorted(set(df_test.index).union(set(df_prod.index)))
-            common_cols = df_test.columns.intersection(df_prod.columns).difference(
-                [id_col, asset_col]
-            )
+def _make_writer(buf):
+    # Kein "in_memory": xlsxwriter schaltet damit constant_memory wieder ab
+    return pd.ExcelWriter(
+        buf,
+        engine="xlsxwriter",
+        engine_kwargs={"options": {"constant_memory": True}},
+    )
 
-            results = []
-            for key in all_keys:
-                row = {
-                    id_col: df_test[id_col].get(key, df_prod[id_col].get(key, "")),
-                    asset_col: df_test[asset_col].get(
-                        key, df_prod[asset_col].get(key, "")
-                    ),
-                }
-
-                if key not in df_test.index:
-                    row["Unterschiede"] = "Nur in Prod"
-                elif key not in df_prod.index:
-                    row["Unterschiede"] = "Nur in Test"
-                else:
-                    diffs = []
-                    for col in common_cols:
-                        val_test = df_test.loc[key, col]
-                        val_prod = df_prod.loc[key, col]
-                        if isinstance(val_test, pd.Series):
-                            val_test = val_test.iloc[0]
-                        if isinstance(val_prod, pd.Series):
-                            val_prod = val_prod.iloc[0]
-
-                        if pd.isna(val_test) and pd.isna(val_prod):
-                            continue
-                        if nearly_equal(val_test, val_prod, TOL):
-                            continue
-
-                        if pd.isna(val_test) or pd.isna(val_prod) or val_test != val_prod:
-                            diffs.append(
-                                f"{col}: Test={val_test} / Prod={val_prod}"
-                            )
-                    row["Unterschiede"] = "; ".join(diffs) if diffs else "Keine"
-                results.append(row)
-
-            df_diff = pd.DataFrame(results)
-            df_diff = df_diff[df_diff["Unterschiede"] != "Keine"]
-
-            st.success(f"✅ Vergleich abgeschlossen. {len(df_diff)} Zeilen analysiert.")
-            st.dataframe(df_diff, use_container_width=True)
-
-            out_result = io.BytesIO()
-            with pd.ExcelWriter(out_result, engine="xlsxwriter") as writer:
-                df_diff.to_excel(writer, index=False, sheet_name="Vergleich")
-            st.download_button(
-                "📥 Vergleichsergebnis herunterladen",
-                data=out_result.getvalue(),
-                file_name="vergleichsergebnis.xlsx",
-                mime=(
-                    "application/vnd.openxmlformats-officedocument."
-                    "spreadsheetml.sheet"
-                ),
-            )
 
-    else:
-        # ====== SECTION 2: Vertragsliste vergleichen (DE) ======
-        st.subheader("📂 Vertragslisten hochladen")
-        file_test = st.file_uploader(
-            "Test-Vertragsliste hochladen", type=["xlsx"], key="test_de_contracts"
-        )
-        file_prod = st.file_uploader(
-            "Prod-Vertragsliste hochladen", type=["xlsx"], key="prod_de_contracts"
+# infer_dtype-Arten, bei denen keine inf- bzw. Datums-/Zeitwerte vorkommen können
+_NO_FLOATS = {"string", "integer", "boolean", "empty", "datetime", "date"}
+_NO_DATES = {"string", "floating", "integer", "mixed-integer-float", "boolean", "empty"}
+_DATE_TYPES = (datetime.date, datetime.time, datetime.timedelta)
+
+
+def _xlsx_column(s):
+    """Spalte aufbereiten wie to_excel (NA leer, ±inf als Text); + Datums-Zeilen."""
+    values = s.to_numpy(dtype=object, copy=True)
+    kind = pd.api.types.infer_dtype(values, skipna=True)
+    missing = pd.isna(values)
+    if kind not in _NO_FLOATS:
+        with np.errstate(invalid="ignore"):
+            pos_inf = ~missing & (values == np.inf)
+            neg_inf = ~missing & (values == -np.inf)
+        values[pos_inf] = "inf"
+        values[neg_inf] = "-inf"
+    values[missing] = None
+    if kind in _NO_DATES:
+        return values, []
+    is_date = np.fromiter(
+        (isinstance(v, _DATE_TYPES) for v in values), dtype=bool, count=len(values)
+    )
+    return values, np.flatnonzero(is_date).tolist()
+
+
+# 💡 xlsx-Export (constant_memory: xlsxwriter hält nur die aktuelle Zeile im
+#     Speicher; to_excel schreibt spaltenweise und würde dabei Zellen verlieren,
+#     deshalb wird hier strikt Zeile für Zeile geschrieben)
+def to_xlsx(df, sheet_name):
+    out = io.BytesIO()
+    with _make_writer(out) as writer:
+        ws = writer.book.add_worksheet(sheet_name)
+        header_fmt = writer.book.add_format(
+            {"bold": True, "border": 1, "align": "center", "valign": "top"}
         )
+        datetime_fmt = writer.book.add_format({"num_format": "yyyy-mm-dd hh:mm:ss"})
+        date_fmt = writer.book.add_format({"num_format": "yyyy-mm-dd"})
+        days_fmt = writer.book.add_format({"num_format": "0"})
+
+        # Spaltenweise vorbereiten; Datumszellen separat mit Format schreiben
+        # (wie to_excel: Uhrzeiten als Text, Zeitspannen als Anzahl Tage)
+        columns, dates = [], []
+        for j in range(df.shape[1]):
+            values, date_rows = _xlsx_column(df.iloc[:, j])
+            for r in date_rows:
+                val, values[r] = values[r], None
+                if isinstance(val, datetime.datetime):
+                    fmt = datetime_fmt
+                elif isinstance(val, datetime.date):
+                    fmt = date_fmt
+                elif isinstance(val, datetime.time):
+                    values[r] = str(val)
+                    continue
+                else:
+                    val, fmt = val.total_seconds() / 86400, days_fmt
+                dates.append((r, j, val, fmt))
+            columns.append(values)
+        dates.sort(key=lambda d: (d[0], d[1]))
+
+        # Spaltennamen sind Text/Zahlen; nur leere Kopfzellen (NaN) bleiben leer
+        header = [None if pd.isna(c) else c for c in df.columns]
+        ws.write_row(0, 0, header, header_fmt)
+        k = 0
+        for i, row in enumerate(zip(*columns)):
+            ws.write_row(i + 1, 0, row)
+            while k < len(dates) and dates[k][0] == i:
+                _, j, val, fmt = dates[k]
+                ws.write(i + 1, j, val, fmt)
+                k += 1
+    return out.getvalue()
+
+
+# 💡 Spaltenabgleich und Download-Dateien, gecacht über die Datei-Digests.
+#     Die schon vorbereiteten DataFrames (_df...) hasht st.cache_data nicht;
+#     Cache-Key sind die Digests bzw. cache_key plus die übrigen Parameter.
+@st.cache_data
+def column_overview(_df_test, _df_prod, test_digest, prod_digest, exclude):
+    columns_test = _df_test.columns.difference(exclude)
+    columns_prod = _df_prod.columns.difference(exclude)
+    return (
+        list(columns_test.difference(columns_prod)),
+        list(columns_prod.difference(columns_test)),
+        list(columns_test.intersection(columns_prod)),
+    )
 
-        system_id_col = "System-ID"
-        asset_col = "Asset System-ID"
-        payment_id_col = "Zahlungs-ID"
-        option_id_col = "Options-ID"
-
-        if file_test and file_prod:
-            df_test = prepare_contract_list(
-                file_test,
-                system_id_col,
-                asset_col,
-                payment_id_col=payment_id_col,
-                option_id_col=option_id_col,
-            )
-            df_prod = prepare_contract_list(
-                file_prod,
-                system_id_col,
-                asset_col,
-                payment_id_col=payment_id_col,
-                option_id_col=option_id_col,
-            )
 
-            # Falls wir wegen fehlender Pflichtspalten leere DFs zurückbekommen,
-            # bricht der Rest hier einfach ab.
-            if df_test.empty and df_prod.empty:
-                st.stop()
+# 💡 Download-Buttons bekommen ein partial statt Bytes, die xlsx wird erst
+#     beim Klick erzeugt (über cache_key einmal je Datei bzw. Ergebnis)
+@st.cache_data
+def xlsx_download(_df, sheet_name, cache_key, index=False):
+    return to_xlsx(_df.reset_index() if index else _df, sheet_name)
 
-            columns_test = set(df_test.columns) - {
-                system_id_col,
-                asset_col,
-                "Key",
-                "LineIndex",
-            }
-            columns_prod = set(df_prod.columns) - {
-                system_id_col,
-                asset_col,
-                "Key",
-                "LineIndex",
-            }
 
-            only_in_test = sorted(columns_test - columns_prod)
-            only_in_prod = sorted(columns_prod - columns_test)
-
-            if only_in_test:
-                st.warning("⚠️ Spalten nur in Test:")
-                st.code("\n".join(only_in_test))
-            if only_in_prod:
-                st.warning("⚠️ Spalten nur in Prod:")
-                st.code("\n".join(only_in_prod))
-            if not only_in_test and not only_in_prod:
-                st.success("✅ Alle Spalten stimmen überein.")
-
-            col1, col2 = st.columns(2)
-            with col1:
-                out_test = io.BytesIO()
-                with pd.ExcelWriter(out_test, engine="xlsxwriter") as writer:
-                    df_test.reset_index().to_excel(
-                        writer, index=False, sheet_name="Vertragsliste_Test"
-                    )
-                st.download_button(
-                    "⬇️ Bereinigte Test-Vertragsliste",
-                    data=out_test.getvalue(),
-                    file_name="vertragsliste_test.xlsx",
-                    mime=(
-                        "application/vnd.openxmlformats-officedocument."
-                        "spreadsheetml.sheet"
-                    ),
-                )
-            with col2:
-                out_prod = io.BytesIO()
-                with pd.ExcelWriter(out_prod, engine="xlsxwriter") as writer:
-                    df_prod.reset_index().to_excel(
-                        writer, index=False, sheet_name="Vertragsliste_Prod"
-                    )
-                st.download_button(
-                    "⬇️ Bereinigte Prod-Vertragsliste",
-                    data=out_prod.getvalue(),
-                    file_name="vertragsliste_prod.xlsx",
-                    mime=(
-                        "application/vnd.openxmlformats-officedocument."
-                        "spreadsheetml.sheet"
-                    ),
-                )
+# 💡 Gemeinsamer Closings-Vergleich, gecacht über die Datei-Digests,
+#     damit Reruns (Tab-Wechsel, Download-Klick) nicht neu vergleichen.
+#     Die bereinigten Closings kommen als _df_* (ungehasht) herein.
+@st.cache_data
+def compare_closings(
+    _df_test,
+    _df_prod,
+    test_digest,
+    prod_digest,
+    id_col,
+    asset_col,
+    diff_col,
+    only_in_test,
+    only_in_prod,
+):
+    # Doppelte Keys bzw. Spaltennamen (Kopfzeile per ffill aufgefüllt):
+    # das erste Vorkommen gewinnt; die Warnung kommt aus render_closings
+    df_test = _df_test.loc[~_df_test.index.duplicated(), ~_df_test.columns.duplicated()]
+    df_prod = _df_prod.loc[~_df_prod.index.duplicated(), ~_df_prod.columns.duplicated()]
+
+    # Hash-Union ohne Zwischensortierung, danach genau einmal sortieren
+    all_keys = df_test.index.union(df_prod.index, sort=False).sort_values()
+    common_cols = df_test.columns.intersection(df_prod.columns).difference(
+        [id_col, asset_col]
+    )
 
-            all_keys = sorted(set(df_test.index).union(set(df_prod.index)))
-            common_cols = df_test.columns.intersection(df_prod.columns).difference(
-                [system_id_col, asset_col, "Key", "LineIndex"]
-            )
+    # Ausgerichtete Teilmatrizen nur für Keys, die in beiden Dateien vorkommen
+    common_keys = df_test.index.intersection(df_prod.index)
+    diffs = collect_diffs(
+        df_test.reindex(index=common_keys, columns=common_cols),
+        df_prod.reindex(index=common_keys, columns=common_cols),
+    )
 
-            results = []
-            for key in all_keys:
-                # System-ID / Asset-ID / Zeile aus der Tabelle holen (egal ob aus Test oder Prod)
-                if key in df_test.index:
-                    src = df_test
-                else:
-                    src = df_prod
-
-                row = {
-                    system_id_col: src.loc[key, system_id_col],
-                    asset_col: src.loc[key, asset_col],
-                }
-
-                if payment_id_col in src.columns:
-                    row[payment_id_col] = src.loc[key, payment_id_col]
-                if option_id_col in src.columns:
-                    row[option_id_col] = src.loc[key, option_id_col]
-                if "LineIndex" in src.columns:
-                    row["Zeilen-Index"] = src.loc[key, "LineIndex"]
-
-                if key not in df_test.index:
-                    row["Unterschiede"] = "Nur in Prod"
-                elif key not in df_prod.index:
-                    row["Unterschiede"] = "Nur in Test"
-                else:
-                    diffs = []
-                    for col in common_cols:
-                        val_test = df_test.loc[key, col]
-                        val_prod = df_prod.loc[key, col]
-
-                        if pd.isna(val_test) and pd.isna(val_prod):
-                            continue
-                        if nearly_equal(val_test, val_prod, TOL):
-                            continue
-
-                        if pd.isna(val_test) or pd.isna(val_prod) or val_test != val_prod:
-                            diffs.append(
-                                f"{col}: Test={val_test} / Prod={val_prod}"
-                            )
-                    row["Unterschiede"] = "; ".join(diffs) if diffs else "Keine"
-                results.append(row)
-
-            df_diff = pd.DataFrame(results)
-            df_diff = df_diff[df_diff["Unterschiede"] != "Keine"]
-
-            st.success(f"✅ Vergleich abgeschlossen. {len(df_diff)} Zeilen analysiert.")
-            st.dataframe(df_diff, use_container_width=True)
-
-            out_result = io.BytesIO()
-            with pd.ExcelWriter(out_result, engine="xlsxwriter") as writer:
-                df_diff.to_excel(
-                    writer, index=False, sheet_name="Vertragslisten-Vergleich"
-                )
-            st.download_button(
-                "📥 Vergleichsergebnis herunterladen",
-                data=out_result.getvalue(),
-                file_name="vertragslisten_vergleich.xlsx",
-                mime=(
-                    "application/vnd.openxmlformats-officedocument."
-                    "spreadsheetml.sheet"
-                ),
-            )
+    # Positionen der Keys in Test/Prod (-1 = nicht vorhanden)
+    i_t = df_test.index.get_indexer(all_keys)
+    i_p = df_prod.index.get_indexer(all_keys)
+    in_t = i_t != -1
+    in_p = i_p != -1
+
+    # Ergebnis-Spalten vorab anlegen und blockweise befüllen
+    n = len(all_keys)
+    id_out = np.empty(n, dtype=object)
+    asset_out = np.empty(n, dtype=object)
+    for out, col in [(id_out, id_col), (asset_out, asset_col)]:
+        out[in_t] = df_test[col].to_numpy()[i_t[in_t]]
+        out[~in_t] = df_prod[col].to_numpy()[i_p[~in_t]]
+
+    diff_out = np.empty(n, dtype=object)
+    diff_out[:] = diffs.reindex(all_keys, fill_value="").to_numpy()
+    diff_out[~in_t] = only_in_prod
+    diff_out[~in_p] = only_in_test
+
+    keep = diff_out != ""  # Zeilen ohne Abweichungen weglassen
+    return pd.DataFrame(
+        {
+            id_col: id_out[keep],
+            asset_col: asset_out[keep],
+            diff_col: diff_out[keep],
+        }
+    )
 
-# 🇬🇧 English
-with tab_en:
-    if mode.startswith("1️⃣"):
-        # ====== SECTION 1: Compare closings (EN) ======
-        st.subheader("📂 Upload files for closings")
-        file_test = st.file_uploader(
-            "Upload Test closing file", type=["xlsx"], key="test_en_closings"
+
+# 💡 Vertragslisten-Vergleich, gecacht über die Datei-Digests. Die vorbereiteten
+#     Listen kommen als _df_* (ungehasht) herein, damit die Warnungen aus
+#     prepare_contract_list nicht über einen verschachtelten Cache doppelt
+#     erscheinen.
+@st.cache_data
+def compare_contract_lists(
+    _df_test,
+    _df_prod,
+    test_digest,
+    prod_digest,
+    system_id_col,
+    asset_col,
+    payment_id_col,
+    option_id_col,
+    common_cols,
+    line_index_col,
+    diff_col,
+    only_in_test,
+    only_in_prod,
+):
+    all_keys = _df_test.index.union(_df_prod.index, sort=False).sort_values()
+
+    # Vergleich nur für Keys, die in beiden Listen vorkommen
+    common_keys = _df_test.index.intersection(_df_prod.index)
+    diffs = collect_diffs(
+        _df_test.reindex(index=common_keys, columns=common_cols),
+        _df_prod.reindex(index=common_keys, columns=common_cols),
+    )
+
+    # Positionen der Keys in Test/Prod (-1 = nicht vorhanden)
+    i_t = _df_test.index.get_indexer(all_keys)
+    i_p = _df_prod.index.get_indexer(all_keys)
+    in_t = i_t != -1
+    in_p = i_p != -1
+
+    # ID-Spalten aus Test holen, für Keys nur in Prod aus Prod
+    results = {}
+    for col, label in [
+        (system_id_col, system_id_col),
+        (asset_col, asset_col),
+        (payment_id_col, payment_id_col),
+        (option_id_col, option_id_col),
+        ("LineIndex", line_index_col),
+    ]:
+        if col not in _df_test.columns and col not in _df_prod.columns:
+            continue
+        out = np.full(len(all_keys), np.nan, dtype=object)
+        if col in _df_test.columns:
+            out[in_t] = _df_test[col].to_numpy()[i_t[in_t]]
+        if col in _df_prod.columns:
+            out[~in_t] = _df_prod[col].to_numpy()[i_p[~in_t]]
+        results[label] = out
+
+    diff_out = diffs.reindex(all_keys, fill_value="").to_numpy(dtype=object, copy=True)
+    diff_out[~in_t] = only_in_prod
+    diff_out[~in_p] = only_in_test
+    results[diff_col] = diff_out
+
+    df_diff = pd.DataFrame(results)
+    return df_diff[df_diff[diff_col] != ""]
+
+
+# 💡 Oberflächentexte je Sprache; die Abschnitte selbst gibt es nur einmal
+@dataclass(frozen=True)
+class LangStrings:
+    subheader: str
+    upload_test_label: str
+    upload_prod_label: str
+    cols_only_in_test: str
+    cols_only_in_prod: str
+    cols_match: str
+    download_test_label: str
+    download_prod_label: str
+    sheet_test: str
+    sheet_prod: str
+    file_test: str
+    file_prod: str
+    diff_column_name: str
+    only_in_test: str
+    only_in_prod: str
+    success_msg: str  # mit Platzhalter {n}
+    download_result_label: str
+    sheet_result: str
+    file_result: str
+    line_index_label: str = ""  # nur Vertragslisten
+
+
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+def _column_banners(ls, only_in_test, only_in_prod):
+    if only_in_test:
+        st.warning(ls.cols_only_in_test)
+        st.code("\n".join(only_in_test))
+    if only_in_prod:
+        st.warning(ls.cols_only_in_prod)
+        st.code("\n".join(only_in_prod))
+    if not only_in_test and not only_in_prod:
+        st.success(ls.cols_match)
+
+
+def _cleaned_downloads(ls, df_test, df_prod, test_key, prod_key):
+    col1, col2 = st.columns(2)
+    with col1:
+        st.download_button(
+            ls.download_test_label,
+            data=partial(xlsx_download, df_test, ls.sheet_test, test_key, index=True),
+            file_name=ls.file_test,
+            mime=XLSX_MIME,
         )
-        file_prod = st.file_uploader(
-            "Upload Prod closing file", type=["xlsx"], key="prod_en_closings"
+    with col2:
+        st.download_button(
+            ls.download_prod_label,
+            data=partial(xlsx_download, df_prod, ls.sheet_prod, prod_key, index=True),
+            file_name=ls.file_prod,
+            mime=XLSX_MIME,
         )
 
-        id_col = "Contract ID"
-        asset_col = "Asset ID"
-
-        if file_test and file_prod:
-            df_test = clean_and_prepare(file_test, id_col, asset_col)
-            df_prod = clean_and_prepare(file_prod, id_col, asset_col)
-
-            columns_test = set(df_test.columns) - {id_col, asset_col, "Key"}
-            columns_prod = set(df_prod.columns) - {id_col, asset_col, "Key"}
-
-            only_in_test = sorted(columns_test - columns_prod)
-            only_in_prod = sorted(columns_prod - columns_test)
-
-            if only_in_test:
-                st.warning("⚠️ Columns only in Test:")
-                st.code("\n".join(only_in_test))
-            if only_in_prod:
-                st.warning("⚠️ Columns only in Prod:")
-                st.code("\n".join(only_in_prod))
-            if not only_in_test and not only_in_prod:
-                st.success("✅ All columns match.")
-
-            col1, col2 = st.columns(2)
-            with col1:
-                out_test = io.BytesIO()
-                with pd.ExcelWriter(out_test, engine="xlsxwriter") as writer:
-                    df_test.reset_index().to_excel(
-                        writer, index=False, sheet_name="Cleaned_Test"
-                    )
-                st.download_button(
-                    "⬇️ Download cleaned Test file",
-                    data=out_test.getvalue(),
-                    file_name="cleaned_test.xlsx",
-                    mime=(
-                        "application/vnd.openxmlformats-officedocument."
-                        "spreadsheetml.sheet"
-                    ),
-                )
-            with col2:
-                out_prod = io.BytesIO()
-                with pd.ExcelWriter(out_prod, engine="xlsxwriter") as writer:
-                    df_prod.reset_index().to_excel(
-                        writer, index=False, sheet_name="Cleaned_Prod"
-                    )
-                st.download_button(
-                    "⬇️ Download cleaned Prod file",
-                    data=out_prod.getvalue(),
-                    file_name="cleaned_prod.xlsx",
-                    mime=(
-                        "application/vnd.openxmlformats-officedocument."
-                        "spreadsheetml.sheet"
-                    ),
-                )
 
-            all_keys = sorted(set(df_test.index).union(set(df_prod.index)))
-            common_cols = df_test.columns.intersection(df_prod.columns).difference(
-                [id_col, asset_col]
-            )
+def _result(ls, df_diff, cache_key):
+    st.success(ls.success_msg.format(n=len(df_diff)))
+    st.dataframe(df_diff, use_container_width=True)
 
-            results = []
-            for key in all_keys:
-                row = {
-                    id_col: df_test[id_col].get(key, df_prod[id_col].get(key, "")),
-                    asset_col: df_test[asset_col].get(
-                        key, df_prod[asset_col].get(key, "")
-                    ),
-                }
-
-                if key not in df_test.index:
-                    row["Differences"] = "Only in Prod"
-                elif key not in df_prod.index:
-                    row["Differences"] = "Only in Test"
-                else:
-                    diffs = []
-                    for col in common_cols:
-                        val_test = df_test.loc[key, col]
-                        val_prod = df_prod.loc[key, col]
-                        if isinstance(val_test, pd.Series):
-                            val_test = val_test.iloc[0]
-                        if isinstance(val_prod, pd.Series):
-                            val_prod = val_prod.iloc[0]
-
-                        if pd.isna(val_test) and pd.isna(val_prod):
-                            continue
-                        if nearly_equal(val_test, val_prod, TOL):
-                            continue
-
-                        if pd.isna(val_test) or pd.isna(val_prod) or val_test != val_prod:
-                            diffs.append(
-                                f"{col}: Test={val_test} / Prod={val_prod}"
-                            )
-                    row["Differences"] = "; ".join(diffs) if diffs else "None"
-                results.append(row)
-
-            df_diff = pd.DataFrame(results)
-            df_diff = df_diff[df_diff["Differences"] != "None"]
-            st.success(f"✅ Comparison complete. {len(df_diff)} rows analyzed.")
-            st.dataframe(df_diff, use_container_width=True)
-
-            out_result = io.BytesIO()
-            with pd.ExcelWriter(out_result, engine="xlsxwriter") as writer:
-                df_diff.to_excel(writer, index=False, sheet_name="Comparison")
-            st.download_button(
-                "📥 Download comparison result",
-                data=out_result.getvalue(),
-                file_name="comparison_result.xlsx",
-                mime=(
-                    "application/vnd.openxmlformats-officedocument."
-                    "spreadsheetml.sheet"
-                ),
-            )
+    st.download_button(
+        ls.download_result_label,
+        data=partial(xlsx_download, df_diff, ls.sheet_result, cache_key),
+        file_name=ls.file_result,
+        mime=XLSX_MIME,
+    )
 
-    else:
-        # ====== SECTION 2: Compare contract list (EN) ======
-        st.subheader("📂 Upload contract lists")
-        file_test = st.file_uploader(
-            "Upload Test contract list", type=["xlsx"], key="test_en_contracts"
-        )
-        file_prod = st.file_uploader(
-            "Upload Prod contract list", type=["xlsx"], key="prod_en_contracts"
-        )
 
-        system_id_col = "System ID"
-        asset_col = "Asset [System ID]"
-        payment_id_col = "Payment ID"
-        option_id_col = "Option ID"
-
-        if file_test and file_prod:
-            df_test = prepare_contract_list(
-                file_test,
-                system_id_col,
-                asset_col,
-                payment_id_col=payment_id_col,
-                option_id_col=option_id_col,
-            )
-            df_prod = prepare_contract_list(
-                file_prod,
-                system_id_col,
-                asset_col,
-                payment_id_col=payment_id_col,
-                option_id_col=option_id_col,
-            )
+# ====== SECTION 1: Closings vergleichen ======
+def render_closings(ls, key_prefix, id_col, asset_col):
+    st.subheader(ls.subheader)
+    file_test = st.file_uploader(
+        ls.upload_test_label, type=["xlsx"], key=f"test_{key_prefix}_closings"
+    )
+    file_prod = st.file_uploader(
+        ls.upload_prod_label, type=["xlsx"], key=f"prod_{key_prefix}_closings"
+    )
+    if not (file_test and file_prod):
+        return
+
+    # Bytes einmal lesen und hashen; der Digest ist der Cache-Key aller Schritte
+    test_bytes = file_test.getvalue()
+    prod_bytes = file_prod.getvalue()
+    test_digest = hashlib.sha256(test_bytes).hexdigest()
+    prod_digest = hashlib.sha256(prod_bytes).hexdigest()
+
+    df_test = clean_and_prepare(test_bytes, test_digest, id_col, asset_col)
+    df_prod = clean_and_prepare(prod_bytes, prod_digest, id_col, asset_col)
+    _warn_duplicate_keys(df_test.index)
+    _warn_duplicate_keys(df_prod.index)
+
+    only_in_test, only_in_prod, _ = column_overview(
+        df_test,
+        df_prod,
+        test_digest,
+        prod_digest,
+        [id_col, asset_col, "Key"],
+    )
+    _column_banners(ls, only_in_test, only_in_prod)
+    _cleaned_downloads(
+        ls,
+        df_test,
+        df_prod,
+        (test_digest, id_col, asset_col),
+        (prod_digest, id_col, asset_col),
+    )
 
-            if df_test.empty and df_prod.empty:
-                st.stop()
+    df_diff = compare_closings(
+        df_test,
+        df_prod,
+        test_digest,
+        prod_digest,
+        id_col,
+        asset_col,
+        diff_col=ls.diff_column_name,
+        only_in_test=ls.only_in_test,
+        only_in_prod=ls.only_in_prod,
+    )
+    _result(ls, df_diff, (test_digest, prod_digest, id_col, asset_col))
 
-            columns_test = set(df_test.columns) - {
-                system_id_col,
-                asset_col,
-                "Key",
-                "LineIndex",
-            }
-            columns_prod = set(df_prod.columns) - {
-                system_id_col,
-                asset_col,
-                "Key",
-                "LineIndex",
-            }
 
-            only_in_test = sorted(columns_test - columns_prod)
-            only_in_prod = sorted(columns_prod - columns_test)
-
-            if only_in_test:
-                st.warning("⚠️ Columns only in Test:")
-                st.code("\n".join(only_in_test))
-            if only_in_prod:
-                st.warning("⚠️ Columns only in Prod:")
-                st.code("\n".join(only_in_prod))
-            if not only_in_test and not only_in_prod:
-                st.success("✅ All columns match.")
-
-            col1, col2 = st.columns(2)
-            with col1:
-                out_test = io.BytesIO()
-                with pd.ExcelWriter(out_test, engine="xlsxwriter") as writer:
-                    df_test.reset_index().to_excel(
-                        writer, index=False, sheet_name="ContractList_Test"
-                    )
-                st.download_button(
-                    "⬇️ Download cleaned Test contract list",
-                    data=out_test.getvalue(),
-                    file_name="contract_list_test.xlsx",
-                    mime=(
-                        "application/vnd.openxmlformats-officedocument."
-                        "spreadsheetml.sheet"
-                    ),
-                )
-            with col2:
-                out_prod = io.BytesIO()
-                with pd.ExcelWriter(out_prod, engine="xlsxwriter") as writer:
-                    df_prod.reset_index().to_excel(
-                        writer, index=False, sheet_name="ContractList_Prod"
-                    )
-                st.download_button(
-                    "⬇️ Download cleaned Prod contract list",
-                    data=out_prod.getvalue(),
-                    file_name="contract_list_prod.xlsx",
-                    mime=(
-                        "application/vnd.openxmlformats-officedocument."
-                        "spreadsheetml.sheet"
-                    ),
-                )
+# ====== SECTION 2: Vertragsliste vergleichen ======
+def render_contracts(
+    ls, key_prefix, system_id_col, asset_col, payment_id_col, option_id_col
+):
+    st.subheader(ls.subheader)
+    file_test = st.file_uploader(
+        ls.upload_test_label, type=["xlsx"], key=f"test_{key_prefix}_contracts"
+    )
+    file_prod = st.file_uploader(
+        ls.upload_prod_label, type=["xlsx"], key=f"prod_{key_prefix}_contracts"
+    )
+    if not (file_test and file_prod):
+        return
+
+    # Bytes einmal lesen und hashen; der Digest ist der Cache-Key aller Schritte
+    test_bytes = file_test.getvalue()
+    prod_bytes = file_prod.getvalue()
+    test_digest = hashlib.sha256(test_bytes).hexdigest()
+    prod_digest = hashlib.sha256(prod_bytes).hexdigest()
+
+    df_test = prepare_contract_list(
+        test_bytes,
+        test_digest,
+        system_id_col,
+        asset_col,
+        payment_id_col=payment_id_col,
+        option_id_col=option_id_col,
+    )
+    df_prod = prepare_contract_list(
+        prod_bytes,
+        prod_digest,
+        system_id_col,
+        asset_col,
+        payment_id_col=payment_id_col,
+        option_id_col=option_id_col,
+    )
 
-            all_keys = sorted(set(df_test.index).union(set(df_prod.index)))
-            common_cols = df_test.columns.intersection(df_prod.columns).difference(
-                [system_id_col, asset_col, "Key", "LineIndex"]
-            )
+    # Falls wir wegen fehlender Pflichtspalten leere DFs zurückbekommen,
+    # bricht der Rest hier einfach ab.
+    if df_test.empty and df_prod.empty:
+        st.stop()
+
+    only_in_test, only_in_prod, common_cols = column_overview(
+        df_test,
+        df_prod,
+        test_digest,
+        prod_digest,
+        [system_id_col, asset_col, "Key", "LineIndex"],
+    )
+    _column_banners(ls, only_in_test, only_in_prod)
+    _cleaned_downloads(
+        ls,
+        df_test,
+        df_prod,
+        (test_digest, system_id_col, asset_col),
+        (prod_digest, system_id_col, asset_col),
+    )
 
-            results = []
-            for key in all_keys:
-                if key in df_test.index:
-                    src = df_test
-                else:
-                    src = df_prod
-
-                row = {
-                    system_id_col: src.loc[key, system_id_col],
-                    asset_col: src.loc[key, asset_col],
-                }
-
-                if payment_id_col in src.columns:
-                    row[payment_id_col] = src.loc[key, payment_id_col]
-                if option_id_col in src.columns:
-                    row[option_id_col] = src.loc[key, option_id_col]
-                if "LineIndex" in src.columns:
-                    row["Line index"] = src.loc[key, "LineIndex"]
-
-                if key not in df_test.index:
-                    row["Differences"] = "Only in Prod"
-                elif key not in df_prod.index:
-                    row["Differences"] = "Only in Test"
-                else:
-                    diffs = []
-                    for col in common_cols:
-                        val_test = df_test.loc[key, col]
-                        val_prod = df_prod.loc[key, col]
-
-                        if pd.isna(val_test) and pd.isna(val_prod):
-                            continue
-                        if nearly_equal(val_test, val_prod, TOL):
-                            continue
-
-                        if pd.isna(val_test) or pd.isna(val_prod) or val_test != val_prod:
-                            diffs.append(
-                                f"{col}: Test={val_test} / Prod={val_prod}"
-                            )
-                    row["Differences"] = "; ".join(diffs) if diffs else "None"
-                results.append(row)
-
-            df_diff = pd.DataFrame(results)
-            df_diff = df_diff[df_diff["Differences"] != "None"]
-            st.success(f"✅ Comparison complete. {len(df_diff)} rows analyzed.")
-            st.dataframe(df_diff, use_container_width=True)
-
-            out_result = io.BytesIO()
-            with pd.ExcelWriter(out_result, engine="xlsxwriter") as writer:
-                df_diff.to_excel(
-                    writer, index=False, sheet_name="ContractList_Comparison"
-                )
-            st.download_button(
-                "📥 Download contract list comparison result",
-                data=out_result.getvalue(),
-                file_name="contract_list_comparison.xlsx",
-                mime=(
-                    "application/vnd.openxmlformats-officedocument."
-                    "spreadsheetml.sheet"
-                ),
-            )
+    df_diff = compare_contract_lists(
+        df_test,
+        df_prod,
+        test_digest,
+        prod_digest,
+        system_id_col,
+        asset_col,
+        payment_id_col,
+        option_id_col,
+        common_cols,
+        line_index_col=ls.line_index_label,
+        diff_col=ls.diff_column_name,
+        only_in_test=ls.only_in_test,
+        only_in_prod=ls.only_in_prod,
+    )
+    _result(ls, df_diff, (test_digest, prod_digest, system_id_col, asset_col))
+
+
+CLOSINGS_DE = LangStrings(
+    subheader="📂 Dateien für Closings hochladen",
+    upload_test_label="Test-Datei (Closings) hochladen",
+    upload_prod_label="Prod-Datei (Closings) hochladen",
+    cols_only_in_test="⚠️ Spalten nur in Test:",
+    cols_only_in_prod="⚠️ Spalten nur in Prod:",
+    cols_match="✅ Alle Spalten stimmen überein.",
+    download_test_label="⬇️ Bereinigte Test-Datei",
+    download_prod_label="⬇️ Bereinigte Prod-Datei",
+    sheet_test="Bereinigt_Test",
+    sheet_prod="Bereinigt_Prod",
+    file_test="bereinigt_test.xlsx",
+    file_prod="bereinigt_prod.xlsx",
+    diff_column_name="Unterschiede",
+    only_in_test="Nur in Test",
+    only_in_prod="Nur in Prod",
+    success_msg="✅ Vergleich abgeschlossen. {n} Zeilen analysiert.",
+    download_result_label="📥 Vergleichsergebnis herunterladen",
+    sheet_result="Vergleich",
+    file_result="vergleichsergebnis.xlsx",
+)
+
+CONTRACTS_DE = LangStrings(
+    subheader="📂 Vertragslisten hochladen",
+    upload_test_label="Test-Vertragsliste hochladen",
+    upload_prod_label="Prod-Vertragsliste hochladen",
+    cols_only_in_test="⚠️ Spalten nur in Test:",
+    cols_only_in_prod="⚠️ Spalten nur in Prod:",
+    cols_match="✅ Alle Spalten stimmen überein.",
+    download_test_label="⬇️ Bereinigte Test-Vertragsliste",
+    download_prod_label="⬇️ Bereinigte Prod-Vertragsliste",
+    sheet_test="Vertragsliste_Test",
+    sheet_prod="Vertragsliste_Prod",
+    file_test="vertragsliste_test.xlsx",
+    file_prod="vertragsliste_prod.xlsx",
+    diff_column_name="Unterschiede",
+    only_in_test="Nur in Test",
+    only_in_prod="Nur in Prod",
+    success_msg="✅ Vergleich abgeschlossen. {n} Zeilen analysiert.",
+    download_result_label="📥 Vergleichsergebnis herunterladen",
+    sheet_result="Vertragslisten-Vergleich",
+    file_result="vertragslisten_vergleich.xlsx",
+    line_index_label="Zeilen-Index",
+)
+
+CLOSINGS_EN = LangStrings(
+    subheader="📂 Upload files for closings",
+    upload_test_label="Upload Test closing file",
+    upload_prod_label="Upload Prod closing file",
+    cols_only_in_test="⚠️ Columns only in Test:",
+    cols_only_in_prod="⚠️ Columns only in Prod:",
+    cols_match="✅ All columns match.",
+    download_test_label="⬇️ Download cleaned Test file",
+    download_prod_label="⬇️ Download cleaned Prod file",
+    sheet_test="Cleaned_Test",
+    sheet_prod="Cleaned_Prod",
+    file_test="cleaned_test.xlsx",
+    file_prod="cleaned_prod.xlsx",
+    diff_column_name="Differences",
+    only_in_test="Only in Test",
+    only_in_prod="Only in Prod",
+    success_msg="✅ Comparison complete. {n} rows analyzed.",
+    download_result_label="📥 Download comparison result",
+    sheet_result="Comparison",
+    file_result="comparison_result.xlsx",
+)
+
+CONTRACTS_EN = LangStrings(
+    subheader="📂 Upload contract lists",
+    upload_test_label="Upload Test contract list",
+    upload_prod_label="Upload Prod contract list",
+    cols_only_in_test="⚠️ Columns only in Test:",
+    cols_only_in_prod="⚠️ Columns only in Prod:",
+    cols_match="✅ All columns match.",
+    download_test_label="⬇️ Download cleaned Test contract list",
+    download_prod_label="⬇️ Download cleaned Prod contract list",
+    sheet_test="ContractList_Test",
+    sheet_prod="ContractList_Prod",
+    file_test="contract_list_test.xlsx",
+    file_prod="contract_list_prod.xlsx",
+    diff_column_name="Differences",
+    only_in_test="Only in Test",
+    only_in_prod="Only in Prod",
+    success_msg="✅ Comparison complete. {n} rows analyzed.",
+    download_result_label="📥 Download contract list comparison result",
+    sheet_result="ContractList_Comparison",
+    file_result="contract_list_comparison.xlsx",
+    line_index_label="Line index",
+)
+
+
+# =============================================================
+
+# 🇩🇪 Deutsch
+with tab_de:
+    if mode.startswith("1️⃣"):
+        render_closings(CLOSINGS_DE, "de", id_col="Vertrags-ID", asset_col="Asset-ID")
+    else:
+        render_contracts(
+            CONTRACTS_DE,
+            "de",
+            system_id_col="System-ID",
+            asset_col="Asset System-ID",
+            payment_id_col="Zahlungs-ID",
+            option_id_col="Options-ID",
+        )
+
+# 🇬🇧 English
+with tab_en:
+    if mode.startswith("1️⃣"):
+        render_closings(CLOSINGS_EN, "en", id_col="Contract ID", asset_col="Asset ID")
+    else:
+        render_contracts(
+            CONTRACTS_EN,
+            "en",
+            system_id_col="System ID",
+            asset_col="Asset [System ID]",
+            payment_id_col="Payment ID",
+            option_id_col="Option ID",
+        )